@@ -1,20 +1,40 @@
-import io
 import zipfile
 import json
-from datetime import datetime
+import time
 import base64
 
-from flask import Flask, render_template, request, send_file, abort, jsonify
+from flask import Flask, Response, render_template, request, abort, jsonify, stream_with_context
 
-from utils.image_processing import generate_batch_images, generate_preview_image, AVAILABLE_FONTS, DEFAULT_FONT_NAME
+from utils.image_processing import generate_batch_images, generate_preview_image, available_fonts, default_font_name
 
 app = Flask(__name__)
+# Cap request bodies at 64 MB; larger uploads get a 413 (smaller ones are still spooled by Werkzeug)
+app.config["MAX_CONTENT_LENGTH"] = 64 * 1024 * 1024
 
 
 @app.route("/", methods=["GET"])
 def index():
     # Pass the dynamically found fonts and the default font to the frontend template
-    return render_template("index.html", fonts=AVAILABLE_FONTS, default_font=DEFAULT_FONT_NAME)
+    return render_template("index.html", fonts=available_fonts(), default_font=default_font_name())
+
+
+class _PipeBuffer:
+    """Write-only file object that collects ZIP output until the response generator drains it."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
 
 
 def _parse_names(raw: str):
@@ -37,7 +57,7 @@ def preview():
         abort(400, "Please enter at least one name for a preview.")
 
     font_color = request.form.get("font_color", "#FFFFFF")
-    font_name = request.form.get("font_name", DEFAULT_FONT_NAME)
+    font_name = request.form.get("font_name", default_font_name())
     positions_json = request.form.get("positions", "{}")
 
     preview_data_urls = []
@@ -73,7 +93,7 @@ def generate():
         abort(400, "Please provide at least one name.")
 
     font_color = request.form.get("font_color", "#FFFFFF")
-    font_name = request.form.get("font_name", DEFAULT_FONT_NAME)
+    font_name = request.form.get("font_name", default_font_name())
     positions_json = request.form.get("positions", "")
     positions = {}
     if positions_json:
@@ -85,22 +105,34 @@ def generate():
     if len(names) > 300:
         abort(400, "Too many names. Please limit to 300 per batch.")
 
-    images_data = generate_batch_images(files, names, font_color, font_name, positions=positions)
+    pipe = _PipeBuffer()
+    # PNGs are already zlib-compressed, so store them as-is
+    zip_file = zipfile.ZipFile(pipe, "w", zipfile.ZIP_STORED)
+    written = generate_batch_images(zip_file, files, names, font_color, font_name, positions=positions)
 
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for filename, img_bytes in images_data:
-            zip_file.writestr(filename, img_bytes)
-    zip_buffer.seek(0)
+    # Render the first tag before any headers go out, so pool or font failures
+    # still surface as a proper error status instead of a broken download
+    next(written, None)
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    zip_name = f"door_tags_{timestamp}.zip"
+    zip_name = f"door_tags_{time.strftime('%Y%m%d_%H%M%S')}.zip"
 
-    return send_file(
-        zip_buffer,
-        as_attachment=True,
-        download_name=zip_name,
+    def stream_zip():
+        try:
+            yield pipe.drain()
+            for _ in written:
+                yield pipe.drain()
+        finally:
+            # Stop in-flight renders if the client disconnects or a tag fails
+            written.close()
+        # Only finish the archive on success; an error above propagates so the server
+        # aborts the response rather than sending a truncated ZIP
+        zip_file.close()
+        yield pipe.drain()
+
+    return Response(
+        stream_with_context(stream_zip()),
         mimetype="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{zip_name}"'},
     )
 
 if __name__ == "__main__":
@@ -1,22 +1,47 @@
+import collections
+import functools
+import hashlib
 import io
+import logging
+import multiprocessing
 import os
 import re
-from typing import List, Tuple, Union
+import threading
+import zipfile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Tuple, Union
 
 from PIL import Image, ImageDraw, ImageFont
 
+logger = logging.getLogger(__name__)
+
 # Locate fonts directory
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 FONT_DIR = os.path.join(BASE_DIR, "static", "fonts")
 
+# zlib level for PNG output; level 1 is several times faster than Pillow's default of 6
+PNG_COMPRESS_LEVEL = int(os.environ.get("PNG_COMPRESS_LEVEL", "1"))
+
 
 # ------------------------------
 # FONT LOADING
 # ------------------------------
 
-def get_available_fonts() -> dict:
+# Common metadata suffixes in font filenames, e.g. "OpenSans-VariableFont_wdth,wght"
+_FONT_META_RE = re.compile(r'[_-]?(Variable|Italic|Static|VF|Flex)', re.IGNORECASE)
+# Positions before uppercase letters in camelCase names
+_CAMEL_CASE_RE = re.compile(r'(?<!^)(?=[A-Z])')
+
+# Define the desired default font and set it if available, otherwise fall back to the first font found.
+DESIRED_DEFAULT_FONT = "Sports World"
+
+
+@functools.cache
+def available_fonts() -> dict:
     """
     Scan the font directory and return a dictionary of font names to file paths.
+    The scan runs on first use rather than at import and is cached for the life of the process.
     """
     fonts = {}
     if not os.path.isdir(FONT_DIR):
@@ -31,10 +56,10 @@ def get_available_fonts() -> dict:
             
             # 2. Split on common metadata keywords like "Variable" or "Italic"
             # e.g., "OpenSans-VariableFont_wdth,wght" -> "OpenSans"
-            name = re.split(r'[_-]?(Variable|Italic|Static|VF|Flex)', name, maxsplit=1, flags=re.IGNORECASE)[0]
+            name = _FONT_META_RE.split(name, maxsplit=1)[0]
 
             # 3. Insert spaces before uppercase letters in camelCase, e.g., "OpenSans" -> "Open Sans"
-            name = re.sub(r'(?<!^)(?=[A-Z])', ' ', name)
+            name = _CAMEL_CASE_RE.sub(' ', name)
 
             # 4. Replace separators and title-case the result
             font_name = name.replace("-", " ").replace("_", " ").strip().title()
@@ -42,19 +67,25 @@ def get_available_fonts() -> dict:
     return fonts
 
 
-AVAILABLE_FONTS = get_available_fonts()
-DEFAULT_FONT_NAME = next(iter(AVAILABLE_FONTS), None)
-
-# Define the desired default font and set it if available, otherwise fall back to the first font found.
-DESIRED_DEFAULT_FONT = "Sports World"
-DEFAULT_FONT_NAME = DESIRED_DEFAULT_FONT if DESIRED_DEFAULT_FONT in AVAILABLE_FONTS else next(iter(AVAILABLE_FONTS), None)
+@functools.cache
+def default_font_name() -> Union[str, None]:
+    """Return DESIRED_DEFAULT_FONT if installed, otherwise the first font found (or None)."""
+    fonts = available_fonts()
+    return DESIRED_DEFAULT_FONT if DESIRED_DEFAULT_FONT in fonts else next(iter(fonts), None)
 
 
+@functools.lru_cache(maxsize=256)
 def _load_font(font_name: str, size: int):
-    """Load a TTF font by name; fallback to Pillow default."""
-    font_path = AVAILABLE_FONTS.get(font_name)
+    """
+    Load a TTF font by name; fallback to Pillow default.
+
+    Cached by (font_name, size) so the size-fitting loop and batch generation
+    don't re-read and re-parse the font file for every probe and every name.
+    Paths from available_fonts() come from a directory scan, so no existence check is needed here.
+    """
+    font_path = available_fonts().get(font_name)
     try:
-        if font_path and os.path.exists(font_path):
+        if font_path:
             return ImageFont.truetype(font_path, size=size)
     except IOError:
         pass
@@ -65,13 +96,100 @@ def _load_font(font_name: str, size: int):
 # IMAGE RESIZING
 # ------------------------------
 
-def _resize_image_if_needed(img: Image.Image, max_width=1000) -> Image.Image:
-    """Resize template images so processing is faster and consistent."""
+def _resize_image_if_needed(img: Image.Image, max_width=1000, resample=Image.BILINEAR) -> Image.Image:
+    """
+    Resize template images so processing is faster and consistent.
+    Defaults to BILINEAR for batch output; the preview passes LANCZOS.
+    """
     if img.width <= max_width:
         return img
     ratio = max_width / img.width
     new_size = (max_width, int(img.height * ratio))
-    return img.resize(new_size, Image.LANCZOS)
+    return img.resize(new_size, resample)
+
+
+# ------------------------------
+# TEMPLATE CACHE
+# ------------------------------
+
+# Resized RGB templates keyed by (upload content hash, resample), most recently used last.
+# Preview and batch each keep one entry per upload, so re-previewing or re-generating
+# with the same templates skips decoding and resizing.
+_TEMPLATE_CACHE = collections.OrderedDict()
+_TEMPLATE_CACHE_SIZE = 16
+_TEMPLATE_CACHE_LOCK = threading.Lock()
+
+
+def _content_hash(stream) -> str:
+    """Hash an upload stream in fixed-size chunks, then rewind it for decoding."""
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in iter(lambda: stream.read(64 * 1024), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def _load_template(file_obj, resample=Image.BILINEAR) -> Image.Image:
+    """
+    Decode an uploaded template and return it resized with `resample` and converted to RGB.
+    The upload is hashed and decoded straight from its stream, which is closed once
+    the pixels are loaded. The returned image is shared through the cache, so callers
+    must copy it before drawing on it.
+    """
+    key = (_content_hash(file_obj.stream), resample)
+
+    with _TEMPLATE_CACHE_LOCK:
+        img = _TEMPLATE_CACHE.get(key)
+        if img is not None:
+            _TEMPLATE_CACHE.move_to_end(key)
+            file_obj.stream.close()
+            return img
+
+    img = Image.open(file_obj.stream)
+    img.load()
+    file_obj.stream.close()
+    img = _resize_image_if_needed(img, resample=resample).convert("RGB")
+
+    with _TEMPLATE_CACHE_LOCK:
+        _TEMPLATE_CACHE[key] = img
+        while len(_TEMPLATE_CACHE) > _TEMPLATE_CACHE_SIZE:
+            _TEMPLATE_CACHE.popitem(last=False)
+    return img
+
+
+# ------------------------------
+# FONT SIZE FITTING
+# ------------------------------
+
+@functools.lru_cache(maxsize=4096)
+def _advance(font_name: str, size: int, ch: str) -> float:
+    """Cached advance width of a single character; names share most of their letters."""
+    return _load_font(font_name, size).getlength(ch)
+
+
+def _fit_size(
+    text: str,
+    font_name: str,
+    max_width: float,
+    stroke_width: int = 3,
+    lo: int = 18,
+    hi: int = 120,
+) -> int:
+    """
+    Binary search for the largest font size in [lo, hi] whose text width fits max_width.
+    Width is the sum of cached per-character advances (ignoring kerning).
+    Falls back to lo when nothing fits.
+    """
+    if hi <= lo:
+        return hi
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        text_w = sum(_advance(font_name, mid, ch) for ch in text) + 2 * stroke_width
+        if text_w <= max_width:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
 
 
 # ------------------------------
@@ -90,29 +208,28 @@ def _draw_text_at_position(
 ) -> Image.Image:
     """
     Draw text at a specific (x, y) coordinate with auto-fit font and stroke.
+    Expects an RGB image and draws on it in place.
     """
 
-    img = img.convert("RGB")
     draw = ImageDraw.Draw(img)
 
     # Font size boundaries
     MAX_FS = int(img.height * 0.12)  # ~12% of height
     MIN_FS = 18                      # Prevent tiny unreadable text
 
-    # Start with largest font size
-    size = MAX_FS
-    font = _load_font(font_name, size)
-
     # Fit name inside allowed width
     max_width_allowed = img.width * width_margin_ratio
+    size = _fit_size(text, font_name, max_width_allowed, stroke_width, lo=MIN_FS, hi=MAX_FS)
+    font = _load_font(font_name, size)
 
-    while size >= MIN_FS:
-        font = _load_font(font_name, size)
+    # Advance widths miss kerning and glyph overhang (e.g. italics), so confirm
+    # the stroked bbox at the chosen size and step down while it still overflows
+    while size > MIN_FS:
         bbox = draw.textbbox((0, 0), text, font=font, stroke_width=stroke_width)
-        text_w = bbox[2] - bbox[0]
-        if text_w <= max_width_allowed:
+        if bbox[2] - bbox[0] <= max_width_allowed:
             break
-        size -= 2
+        size -= 1
+        font = _load_font(font_name, size)
 
     draw.text(
         position_xy,
@@ -139,8 +256,8 @@ def generate_preview_image(
     position: dict,
 ) -> bytes:
     """Generate one preview PNG based on first template, first name, and selected options."""
-    img = Image.open(file_obj.stream)
-    img = _resize_image_if_needed(img)
+    # Copy so drawing doesn't touch the cached template
+    img = _load_template(file_obj, resample=Image.LANCZOS).copy()
 
     # Calculate position from fractional coordinates
     try:
@@ -154,7 +271,7 @@ def generate_preview_image(
     img = _draw_text_at_position(img, name, (cx, cy), font_name, font_color, stroke_width=3)
 
     buf = io.BytesIO()
-    img.save(buf, format="PNG")
+    img.save(buf, format="PNG", compress_level=PNG_COMPRESS_LEVEL, optimize=False)
     return buf.getvalue()
 
 
@@ -162,59 +279,217 @@ def generate_preview_image(
 # BATCH IMAGE GENERATION
 # ------------------------------
 
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def _get_executor():
+    """
+    Return the shared pool used for batch rendering, creating it on first use.
+    Prefers a process pool; on platforms that can't spawn processes (e.g. serverless
+    runtimes without /dev/shm) falls back to a thread pool, which still overlaps work
+    because Pillow releases the GIL while zlib encodes PNGs.
+    Returns None when only one CPU is available; callers then render serially.
+    """
+    global _EXECUTOR
+    workers = os.cpu_count() or 1
+    if workers < 2:
+        return None
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            try:
+                # Workers are started from Flask's request threads, where forking the
+                # whole (multi-threaded) server process risks deadlocks in the child
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                _EXECUTOR = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+            except (OSError, ValueError, NotImplementedError, ImportError):
+                _EXECUTOR = ThreadPoolExecutor(max_workers=workers)
+        return _EXECUTOR
+
+
+def _discard_executor(executor: Executor):
+    """Drop a broken pool so the next batch creates a fresh one."""
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is executor:
+            _EXECUTOR = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _chunk_by_template(tasks: list) -> List[list]:
+    """
+    Group tasks into chunks that share one template, ordered by their first name.
+    Pickle writes a shared bytes object once per submission, so each chunk ships its
+    template pixels once. Chunks shrink as the template count grows, keeping the
+    number of out-of-order results waiting to be written around 64.
+    """
+    template_count = len({id(task[0]) for task in tasks})
+    chunk_size = min(8, max(1, 64 // template_count))
+
+    chunks = []
+    open_chunks = {}
+    for task in tasks:
+        chunk = open_chunks.get(id(task[0]))
+        if chunk is None or len(chunk) >= chunk_size:
+            chunk = []
+            open_chunks[id(task[0])] = chunk
+            chunks.append(chunk)
+        chunk.append(task)
+    return chunks
+
+
+def _dispatch_tags(executor: Executor, tasks: list, window: int) -> Iterator[Tuple[str, bytes]]:
+    """
+    Render tasks on the pool in template-sharing chunks and yield (filename, png_bytes)
+    in name order. At most `window` chunks are in flight, so finished PNGs wait in a
+    bounded buffer for the ZIP writer instead of piling up.
+    """
+    pending = collections.deque()
+    ready = {}
+    next_idx = 0
+    try:
+        for chunk in _chunk_by_template(tasks):
+            if len(pending) >= window:
+                ready.update(pending.popleft().result())
+            pending.append(executor.submit(_render_chunk, chunk))
+            while next_idx in ready:
+                yield ready.pop(next_idx)
+                next_idx += 1
+        while pending:
+            ready.update(pending.popleft().result())
+            while next_idx in ready:
+                yield ready.pop(next_idx)
+                next_idx += 1
+    finally:
+        # Drop chunks that haven't started if the consumer stops early (e.g. client disconnect)
+        for future in pending:
+            future.cancel()
+
+
+_SCRATCH = threading.local()
+
+# Anything other than letters, digits, spaces, underscores and hyphens (Unicode-aware, like str.isalnum)
+_UNSAFE_FILENAME_RE = re.compile(r"[^\w \-]+")
+
+
+def _scratch_image(size: Tuple[int, int]) -> Image.Image:
+    """Return this thread's reusable RGB canvas of the given size, allocating it only when the size changes."""
+    img = getattr(_SCRATCH, "img", None)
+    if img is None or img.size != size:
+        img = Image.new("RGB", size)
+        _SCRATCH.img = img
+    return img
+
+
+def _draw_tag(task) -> Tuple[str, Image.Image]:
+    """Draw one name onto a raw RGB template and return (filename, image)."""
+    raw, size, idx, name, position_xy, font_name, font_color = task
+
+    # Refill the scratch canvas in place instead of allocating a new image per tag
+    img = _scratch_image(size)
+    img.frombytes(raw)
+    img = _draw_text_at_position(img, name, position_xy, font_name, font_color=font_color, stroke_width=3)
+
+    # Safe filename
+    safe = _UNSAFE_FILENAME_RE.sub("", name).strip() or f"resident_{idx+1}"
+
+    filename = f"{idx+1:03d}_{safe}.png"
+    return filename, img
+
+
+def _render_chunk(chunk: list) -> List[Tuple[int, Tuple[str, bytes]]]:
+    """Pool entry point: draw and encode each task in the chunk, returning (idx, (filename, png_bytes))."""
+    results = []
+    for task in chunk:
+        filename, img = _draw_tag(task)
+        buf = io.BytesIO()
+        img.save(buf, format="PNG", compress_level=PNG_COMPRESS_LEVEL, optimize=False)
+        results.append((task[2], (filename, buf.getvalue())))
+    return results
+
+
+def _write_tags_serially(zip_file: zipfile.ZipFile, tasks: list) -> Iterator[str]:
+    """Render tasks in this thread, saving each PNG straight into its ZIP entry."""
+    for task in tasks:
+        filename, img = _draw_tag(task)
+        with zip_file.open(filename, "w") as entry:
+            img.save(entry, format="PNG", compress_level=PNG_COMPRESS_LEVEL, optimize=False)
+        yield filename
+
+
+def _write_tags(zip_file: zipfile.ZipFile, tasks: list) -> Iterator[str]:
+    """Render each task into its own ZIP entry, yielding the filename after each one is written."""
+    executor = _get_executor()
+    if executor is None or len(tasks) < 2:
+        yield from _write_tags_serially(zip_file, tasks)
+        return
+
+    # Workers draw and encode the next chunks while this thread writes earlier tags out
+    window = (os.cpu_count() or 1) + 1
+    written = 0
+    results = _dispatch_tags(executor, tasks, window)
+    try:
+        for filename, img_bytes in results:
+            zip_file.writestr(filename, img_bytes)
+            written += 1
+            yield filename
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed); replace the pool and finish this batch here
+        logger.warning("Render pool broke after %d of %d tags; finishing serially", written, len(tasks))
+        _discard_executor(executor)
+        yield from _write_tags_serially(zip_file, tasks[written:])
+    finally:
+        results.close()
+
+
 def generate_batch_images(
+    zip_file: zipfile.ZipFile,
     files,
     names: List[str],
     font_color: str,
     font_name: str,
     positions: Union[dict, None] = None,
-) -> List[Tuple[str, bytes]]:
+) -> Iterator[str]:
     """
-    Generate all name tags and return list of (filename, image_bytes).
+    Generate all name tags as PNG entries in zip_file, in name order.
+    Templates are decoded immediately; the returned iterator does the rendering and
+    yields each filename once its entry is written, so callers can stream the archive.
+    Each tag is rendered independently, so the work is spread across a worker pool.
     """
 
-    # Load all uploaded templates into memory & resize for consistency
+    # Keep only each template's raw pixels; workers rebuild the template from these bytes
     templates = []
     for file_obj in files:
-        img = Image.open(file_obj.stream)
-        img = _resize_image_if_needed(img)
-        templates.append(img.copy())
+        img = _load_template(file_obj)
+        templates.append((img.tobytes(), img.size))
 
-    results = []
     tcount = len(templates)
     if not tcount:
-        return []
-
-    for idx, name in enumerate(names):
-        t_idx = idx % tcount
-        template = templates[t_idx].copy()
+        return _write_tags(zip_file, [])
 
+    # Resolve each template's text anchor once; it doesn't depend on the name
+    if not isinstance(positions, dict):
+        positions = {}
+    anchors = []
+    for t_idx, (_, (width, height)) in enumerate(templates):
         # Default: center
-        cx = template.width // 2
-        cy = template.height // 2
+        cx = width // 2
+        cy = height // 2
 
         # If manual position provided for this template, use it
-        if positions and str(t_idx) in positions:
-            frac = positions[str(t_idx)]
+        frac = positions.get(str(t_idx))
+        if frac:
             try:
-                fx = float(frac.get("x", 0.5))
-                fy = float(frac.get("y", 0.5))
-                cx = int(fx * template.width)
-                cy = int(fy * template.height)
-            except (ValueError, TypeError):
-                pass  # Keep default on parsing error
-
-        img = _draw_text_at_position(template, name, (cx, cy), font_name, font_color=font_color, stroke_width=3)
-
-        # Safe filename
-        safe = "".join(c for c in name if c.isalnum() or c in (" ", "_", "-")).strip()
-        if not safe:
-            safe = f"resident_{idx+1}"
+                cx = int(float(frac.get("x", 0.5)) * width)
+                cy = int(float(frac.get("y", 0.5)) * height)
+            except (ValueError, TypeError, AttributeError):
+                cx, cy = width // 2, height // 2  # Keep default on parsing error
+        anchors.append((cx, cy))
 
-        filename = f"{idx+1:03d}_{safe}.png"
-
-        buf = io.BytesIO()
-        img.save(buf, format="PNG")
-        results.append((filename, buf.getvalue()))
+    tasks = []
+    for idx, name in enumerate(names):
+        t_idx = idx % tcount
+        raw, size = templates[t_idx]
+        tasks.append((raw, size, idx, name, anchors[t_idx], font_name, font_color))
 
-    return results
+    return _write_tags(zip_file, tasks)